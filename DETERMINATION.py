@@ -6,95 +6,557 @@
 # --- SETUP ---
 # 1. Install necessary libraries:
 #    pip install -U py-cord google-generativeai python-dotenv
+#    (optional, to share rate limits between shards) pip install -U redis
 #
 # 2. Create a file named DETERMINATION.env in the same directory as this script.
 #
 # 3. Inside the DETERMINATION.env file, add your secret keys:
 #    DISCORD_BOT_TOKEN="YOUR_DISCORD_BOT_TOKEN_HERE"
 #    GEMINI_API_KEY="YOUR_GEMINI_API_KEY_HERE"
+#    REDIS_URL="redis://localhost:6379/0"  (optional)
 #
 # 4. Get your credentials from the Discord Developer Portal and Google AI Studio.
 #
 # 5. Run the bot from your terminal:
-#    python DETERMINATION.py
+#    python main.py
 
+import asyncio
+import atexit
+import hashlib
+import logging
+import logging.handlers
 import os
+import queue
 import random
 import re
 import time
-from collections import deque
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import NamedTuple
 import discord
 from discord.ui import InputText, Modal
 import google.generativeai as genai
+from google.generativeai import client as genai_client
 from dotenv import load_dotenv
 
+try:
+    import redis.asyncio as aioredis  # Optional, only needed with REDIS_URL
+except ImportError:
+    aioredis = None
+
+# --- LOGGING ---
+# Records are handed to a queue and written by a QueueListener thread, so
+# terminal I/O never blocks the event loop.
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(
+    logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logger = logging.getLogger("DETERMINATION")
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.propagate = False
+
 # --- CORE CONFIGURATION ---
 load_dotenv(dotenv_path='DETERMINATION.env')
 DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+REDIS_URL = os.getenv("REDIS_URL")
 
 if not DISCORD_BOT_TOKEN or not GEMINI_API_KEY:
     raise ValueError("Discord token or Gemini API key not found in .env file.")
 
-# Configure Gemini API
+# Configure Gemini API once; every call reuses the same model and the SDK's
+# cached client, so requests share a single keep-alive gRPC channel.
 genai.configure(api_key=GEMINI_API_KEY)
-gemini_model = genai.GenerativeModel('gemini-2.5-flash-lite')
+GEMINI_MODEL_NAME = 'gemini-2.5-flash-lite'
+gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+
+# --- TAROT DECK ---
+_MAJOR_ARCANA = (
+    "Chàng Khờ", "Nhà Ảo Thuật", "Nữ Tư Tế", "Hoàng Hậu", "Hoàng Đế",
+    "Giáo Hoàng", "Tình Nhân", "Cỗ Xe", "Sức Mạnh", "Ẩn Sĩ",
+    "Vòng Quay May Mắn", "Công Lý", "Người Treo Ngược", "Cái Chết",
+    "Tiết Chế", "Ác Quỷ", "Tòa Tháp", "Ngôi Sao", "Mặt Trăng", "Mặt Trời",
+    "Phán Xét", "Thế Giới")
+_MINOR_RANKS = ("Át", "Hai", "Ba", "Bốn", "Năm", "Sáu", "Bảy", "Tám", "Chín",
+                "Mười", "Tiểu Đồng", "Hiệp Sĩ", "Nữ Hoàng", "Vua")
+_MINOR_SUITS = ("Gậy", "Cốc", "Kiếm", "Tiền")
+TAROT_CARDS = _MAJOR_ARCANA + tuple(
+    f"{rank} {suit}" for suit in _MINOR_SUITS for rank in _MINOR_RANKS)
+TAROT_ORIENTATIONS = ("Xuôi", "Ngược")
+
+# Dice notation accepted by /diceroll, e.g. 2d6 or 1d20.
+_DICE_RE = re.compile(r'(\d+)d(\d+)')
+
+
+# --- PROMPTS ---
+_TAROT_PROMPT_TMPL = (
+    "Bạn là một chuyên gia Tarot sâu sắc và thấu cảm. "
+    "Lá bài đã được rút là '{card}'. Người dùng có câu hỏi: '{question}'. "
+    "Hãy phân tích, kết nối ý nghĩa của lá bài với câu hỏi để đưa ra một lời khuyên chân thành, "
+    "chi tiết và sâu sắc. Sử dụng ngôn ngữ tiếng Việt tự nhiên, gần gũi.")
+_YESNO_PROMPT_TMPL = (
+    "Bạn là một nhà tiên tri hóm hỉnh. Với câu hỏi '{question}', "
+    "số phận đã thì thầm câu trả lời là '{answer}'. "
+    "Hãy diễn giải câu trả lời này một cách đầy ẩn ý, thú vị, và đừng tiết lộ trực tiếp 'Có' hay 'Không'. "
+    "Hãy trả lời bằng tiếng Việt.")
+_DICE_PROMPT_TMPL = (
+    "Bạn là một người dẫn truyện game đầy kịch tính. Người chơi vừa tung {dice}. "
+    "Kết quả từng viên là: {rolls}. Tổng điểm là {total}. "
+    "Hãy tường thuật lại cảnh tung xúc xắc này một cách hào hùng và sống động. "
+    "Nhấn mạnh vào kết quả cuối cùng. Hãy trả lời bằng tiếng Việt.")
 
 
 # --- RATE LIMITING ---
-class RateLimiter:
+class BucketCounter:
+    """Counts events over a sliding window split into fixed-size time buckets."""
+    __slots__ = ('num_buckets', 'bucket_seconds', 'buckets', 'total',
+                 'current_bucket')
+
+    def __init__(self, num_buckets: int, bucket_seconds: int):
+        self.num_buckets = num_buckets
+        self.bucket_seconds = bucket_seconds
+        self.buckets = [0] * num_buckets
+        self.total = 0
+        self.current_bucket = 0  # Absolute bucket number (time // bucket_seconds)
+
+    def _advance(self, current_time: float):
+        """Zeroes the buckets that have slid out of the window since the last call."""
+        bucket = int(current_time // self.bucket_seconds)
+        elapsed = bucket - self.current_bucket
+        if elapsed <= 0:
+            return
+        if elapsed >= self.num_buckets:
+            self.buckets = [0] * self.num_buckets
+            self.total = 0
+        else:
+            for stale in range(self.current_bucket + 1, bucket + 1):
+                index = stale % self.num_buckets
+                self.total -= self.buckets[index]
+                self.buckets[index] = 0
+        self.current_bucket = bucket
+
+    def count(self, current_time: float) -> int:
+        self._advance(current_time)
+        return self.total
+
+    def add(self, current_time: float):
+        self._advance(current_time)
+        self.buckets[self.current_bucket % self.num_buckets] += 1
+        self.total += 1
+
+    def remove(self, current_time: float, event_time: float):
+        """Takes back an event added at event_time, if it is still inside the window."""
+        self._advance(current_time)
+        bucket = int(event_time // self.bucket_seconds)
+        if self.current_bucket - bucket >= self.num_buckets:
+            return
+        index = bucket % self.num_buckets
+        if self.buckets[index]:
+            self.buckets[index] -= 1
+            self.total -= 1
 
-    def __init__(self, rpm_limit: int, daily_limit: int):
-        self.rpm_limit = rpm_limit
-        self.daily_limit = daily_limit
-        self.requests_minute = deque()
-        self.requests_day = deque()
 
-    def check(self) -> tuple[bool, str]:
-        """Checks if a request is allowed. Returns (is_limited, message)."""
-        current_time = time.time()
+_BUSY_MSG = "Bot đang bận suy nghĩ! Vui lòng thử lại sau một phút."
+_DAILY_LIMIT_MSG = "Hôm nay bot đã dùng hết năng lượng rồi. Hẹn gặp lại bạn vào ngày mai nhé!"
+
 
-        # Clean old timestamps
-        while self.requests_minute and current_time - self.requests_minute[
-                0] > 60:
-            self.requests_minute.popleft()
-        while self.requests_day and current_time - self.requests_day[0] > 86400:
-            self.requests_day.popleft()
+class Reservation(NamedTuple):
+    """A daily slot reserved by acquire(), handed back to release()."""
+    backend: str  # "local" or "redis", whichever limiter reserved the slot
+    token: float | str  # Local reservation time, or the Redis sorted-set member
 
-        # Check limits
-        if len(self.requests_minute) >= self.rpm_limit:
-            return True, "Bot đang bận suy nghĩ! Vui lòng thử lại sau một phút."
-        if len(self.requests_day) >= self.daily_limit:
-            return True, "Hôm nay bot đã dùng hết năng lượng rồi. Hẹn gặp lại bạn vào ngày mai nhé!"
 
-        return False, ""
+def estimate_tokens(text: str) -> int:
+    """Rough token count for a prompt (about four characters per token)."""
+    return len(text) // 4
 
-    def record_request(self):
-        """Records a new request timestamp."""
-        current_time = time.time()
-        self.requests_minute.append(current_time)
-        self.requests_day.append(current_time)
 
+class TokenBucket:
+    __slots__ = ('rpm_limit', 'tpm_limit', 'daily_limit', 'max_wait',
+                 'request_tokens', 'token_tokens', 'last_update',
+                 'requests_day', '_lock')
+
+    def __init__(self, rpm_limit: int, tpm_limit: int, daily_limit: int,
+                 max_wait: float = 30):
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.daily_limit = daily_limit
+        self.max_wait = max_wait
+        self.request_tokens = float(rpm_limit)
+        self.token_tokens = float(tpm_limit)
+        self.last_update = time.monotonic()
+        self.requests_day = BucketCounter(num_buckets=1440, bucket_seconds=60)
+        self._lock = asyncio.Lock()
+
+    def _refill(self, current_time: float):
+        elapsed = current_time - self.last_update
+        self.request_tokens = min(
+            self.rpm_limit,
+            self.request_tokens + elapsed * self.rpm_limit / 60)
+        self.token_tokens = min(
+            self.tpm_limit, self.token_tokens + elapsed * self.tpm_limit / 60)
+        self.last_update = current_time
+
+    async def acquire(
+        self, estimated_tokens: int
+    ) -> tuple[bool, str, float, Reservation | None]:
+        """Admits a request into the RPM and TPM budgets. Returns (is_limited, message, wait_time, reservation).
+
+        Nothing sleeps here: an admitted request is charged at once, letting the
+        buckets go into debt, and the caller waits wait_time seconds before
+        calling Gemini. Only the daily quota or a wait longer than max_wait
+        turns a request away, so rejections can be answered immediately. An
+        admitted request also reserves a daily slot; pass the reservation to
+        release() if the Gemini call fails.
+        """
+        estimated_tokens = min(estimated_tokens, self.tpm_limit)
+        async with self._lock:
+            current_time = time.monotonic()
+            if self.requests_day.count(current_time) >= self.daily_limit:
+                return True, _DAILY_LIMIT_MSG, 0.0, None
+
+            self._refill(current_time)
+            wait_time = max(
+                0.0, (1 - self.request_tokens) * 60 / self.rpm_limit,
+                (estimated_tokens - self.token_tokens) * 60 / self.tpm_limit)
+            if wait_time > self.max_wait:
+                return True, _BUSY_MSG, 0.0, None
+
+            self.request_tokens -= 1
+            self.token_tokens -= estimated_tokens
+            self.requests_day.add(current_time)
+            return False, "", wait_time, Reservation("local", current_time)
+
+    async def release(self, reservation: Reservation):
+        """Gives back the daily slot reserved by acquire()."""
+        async with self._lock:
+            self.requests_day.remove(time.monotonic(), reservation.token)
+
+
+class RedisRateLimiter:
+    """Sliding-window limiter kept in Redis sorted sets, shared by every shard.
+
+    While Redis is unreachable, requests go through an in-process TokenBucket
+    with the same limits instead.
+    """
+    __slots__ = ('rpm_limit', 'daily_limit', 'max_wait', 'redis', 'fallback',
+                 '_acquire_script', '_cleanup_counter')
+
+    # KEYS: minute key, day key. ARGV: now, rpm_limit, daily_limit, member,
+    # cleanup flag, max_wait. Windows are counted with ZCOUNT, so expired
+    # entries only need pruning when the cleanup flag is set. An admitted
+    # request is scored at the time its minute slot frees up, which may be in
+    # the future, and reserves a daily slot in the same step. Returns -1 when
+    # the daily quota is spent, -2 when the wait would exceed max_wait,
+    # otherwise the milliseconds to wait before calling Gemini.
+    _ACQUIRE_LUA = """
+        local now = tonumber(ARGV[1])
+        local rpm_limit = tonumber(ARGV[2])
+        local minute_start = '(' .. (now - 60)
+        if ARGV[5] == '1' then
+            redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - 60)
+            redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - 86400)
+        end
+        if redis.call('ZCOUNT', KEYS[2], '(' .. (now - 86400), '+inf') >= tonumber(ARGV[3]) then
+            return -1
+        end
+        local admit_at = now
+        local count = redis.call('ZCOUNT', KEYS[1], minute_start, '+inf')
+        if count >= rpm_limit then
+            local blocking = redis.call('ZRANGEBYSCORE', KEYS[1], minute_start, '+inf',
+                                        'WITHSCORES', 'LIMIT', count - rpm_limit, 1)
+            admit_at = tonumber(blocking[2]) + 60
+        end
+        if admit_at - now > tonumber(ARGV[6]) then
+            return -2
+        end
+        redis.call('ZADD', KEYS[1], admit_at, ARGV[4])
+        redis.call('EXPIRE', KEYS[1], math.ceil(admit_at - now) + 60)
+        redis.call('ZADD', KEYS[2], now, ARGV[4])
+        redis.call('EXPIRE', KEYS[2], 86400)
+        return math.ceil((admit_at - now) * 1000)
+    """
+    MINUTE_KEY = "gemini:rpm"
+    DAY_KEY = "gemini:daily"
+    CLEANUP_EVERY = 16  # acquire() calls between prunes of expired entries
+    # Seconds before a stalled Redis counts as down. acquire() runs before the
+    # interaction is acknowledged, so this must stay well under Discord's 3s.
+    SOCKET_TIMEOUT = 1
+
+    def __init__(self, redis_url: str, rpm_limit: int, tpm_limit: int,
+                 daily_limit: int, max_wait: float = 30):
+        if aioredis is None:
+            raise ValueError(
+                "REDIS_URL is set but the redis package is not installed.")
 
-limiter = RateLimiter(rpm_limit=10, daily_limit=499)
+        self.rpm_limit = rpm_limit
+        self.daily_limit = daily_limit
+        self.max_wait = max_wait
+        self.redis = aioredis.from_url(
+            redis_url,
+            socket_connect_timeout=self.SOCKET_TIMEOUT,
+            socket_timeout=self.SOCKET_TIMEOUT)
+        self.fallback = TokenBucket(rpm_limit, tpm_limit, daily_limit,
+                                    max_wait)
+        self._acquire_script = self.redis.register_script(self._ACQUIRE_LUA)
+        self._cleanup_counter = 0
+
+    async def acquire(
+        self, estimated_tokens: int
+    ) -> tuple[bool, str, float, Reservation | None]:
+        """Admits a request into the shared minute window. Returns (is_limited, message, wait_time, reservation).
+
+        Token usage is not tracked across shards; estimated_tokens only
+        applies when the local fallback admits the request.
+        """
+        self._cleanup_counter = (self._cleanup_counter + 1) % self.CLEANUP_EVERY
+        cleanup = 1 if self._cleanup_counter == 0 else 0
+        member = uuid.uuid4().hex
+        try:
+            result = int(await self._acquire_script(
+                keys=[self.MINUTE_KEY, self.DAY_KEY],
+                args=[time.time(), self.rpm_limit, self.daily_limit, member,
+                      cleanup, self.max_wait]))
+        except aioredis.RedisError as e:
+            logger.warning("Redis rate limiter unavailable, using local limits: %s", e)
+            return await self.fallback.acquire(estimated_tokens)
+        if result == -1:
+            return True, _DAILY_LIMIT_MSG, 0.0, None
+        if result == -2:
+            return True, _BUSY_MSG, 0.0, None
+        return False, "", result / 1000, Reservation("redis", member)
+
+    async def release(self, reservation: Reservation):
+        """Gives back a daily slot to whichever limiter reserved it."""
+        if reservation.backend == "local":
+            await self.fallback.release(reservation)
+            return
+        try:
+            await self.redis.zrem(self.DAY_KEY, reservation.token)
+        except aioredis.RedisError as e:
+            logger.warning("Could not release Redis daily slot: %s", e)
+
+
+if REDIS_URL:
+    limiter = RedisRateLimiter(REDIS_URL,
+                               rpm_limit=10,
+                               tpm_limit=250_000,
+                               daily_limit=499)
+else:
+    limiter = TokenBucket(rpm_limit=10, tpm_limit=250_000, daily_limit=499)
+
+
+# --- RESPONSE CACHE ---
+class ResponseCache:
+    __slots__ = ('max_size', 'ttl', 'entries')
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def make_key(prompt: str) -> str:
+        return hashlib.sha256(
+            (prompt + GEMINI_MODEL_NAME).encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Returns the cached text for a key, or None if missing or expired."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        timestamp, text = entry
+        if time.monotonic() - timestamp > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return text
+
+    def put(self, key: str, text: str):
+        """Stores a response, evicting the least recently used one when full."""
+        self.entries[key] = (time.monotonic(), text)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+response_cache = ResponseCache(max_size=512, ttl=3600)
 
 # --- BOT INITIALIZATION ---
-intents = discord.Intents.default()
-bot = discord.Bot(intents=intents)
+# Slash commands arrive as interactions, so only the guilds intent is needed.
+intents = discord.Intents.none()
+intents.guilds = True
+# The bot never reads messages or members, so skip caching and chunking them.
+bot = discord.Bot(intents=intents,
+                  max_messages=None,
+                  chunk_guilds_at_startup=False,
+                  member_cache_flags=discord.MemberCacheFlags.none())
 
 
 # --- GEMINI HELPER ---
-async def ask_gemini(prompt: str) -> str:
-    """A robust helper to query the Gemini API with error handling."""
-    print(f"Querying Gemini: '{prompt[:60]}...'")
+EMBED_DESCRIPTION_LIMIT = 4096
+EMBED_FIELD_LIMIT = 1024
+MESSAGE_CONTENT_LIMIT = 2000
+
+
+def truncate(text: str, limit: int) -> str:
+    """Shortens text to fit a Discord length limit, marking the cut with '…'."""
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+# Finish reasons of a stream that ended normally rather than being cut off.
+_COMPLETE_FINISH_REASONS = (genai.protos.Candidate.FinishReason.STOP,
+                            genai.protos.Candidate.FinishReason.MAX_TOKENS)
+
+# Seconds between streamed message edits. Discord allows 5 edits per 5s, so
+# this leaves room for the final edit within the same window.
+STREAM_EDIT_INTERVAL = 1.25
+
+
+class GeminiReply(NamedTuple):
+    text: str
+    ok: bool  # False when text is an error message rather than a response
+    prompt_len: int
+    latency: float  # Seconds spent in ask_gemini
+    cache_hit: bool
+
+
+def cached_reply(prompt: str) -> GeminiReply | None:
+    """Returns the cached response to prompt, or None when it has to be generated."""
+    started = time.perf_counter()
+    text = response_cache.get(ResponseCache.make_key(prompt))
+    if text is None:
+        return None
+    return GeminiReply(text, True, len(prompt), time.perf_counter() - started,
+                       True)
+
+
+async def ask_gemini(
+        prompt: str, on_partial: Callable[[str], Awaitable[None]]) -> GeminiReply:
+    """A robust helper to query the Gemini API with error handling.
+
+    The response is streamed, and on_partial is awaited with the text
+    received so far at most every STREAM_EDIT_INTERVAL seconds. Successful
+    responses are stored in the response cache; look there first with
+    cached_reply() so a hit never reaches the rate limiter.
+    """
+    started = time.perf_counter()
+    text, ok = await _query_gemini(prompt, on_partial,
+                                   ResponseCache.make_key(prompt))
+    return GeminiReply(text, ok, len(prompt), time.perf_counter() - started,
+                       False)
+
+
+async def _query_gemini(prompt: str,
+                        on_partial: Callable[[str], Awaitable[None]],
+                        key: str) -> tuple[str, bool]:
+    """Calls Gemini and returns (text, ok); on failure text is an error message."""
+    try:
+        response = await gemini_model.generate_content_async(prompt,
+                                                             stream=True)
+        text = ""
+        finish_reason = None
+        last_edit = time.monotonic()
+        async for chunk in response:
+            if not chunk.candidates:
+                continue
+            finish_reason = chunk.candidates[0].finish_reason
+            if not chunk.parts:
+                continue
+            text += chunk.text
+            if time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL:
+                try:
+                    await on_partial(text)
+                except discord.HTTPException as e:
+                    # A failed progress edit must not discard the response.
+                    logger.warning("Streaming edit failed: %s", e)
+                last_edit = time.monotonic()
+        # A stream cut short by SAFETY, RECITATION etc. ends without raising,
+        # so only a normal finish counts as a complete answer worth caching.
+        if not text or finish_reason not in _COMPLETE_FINISH_REASONS:
+            logger.warning("Gemini stopped early: finish_reason=%s",
+                           finish_reason)
+            return "Rất tiếc, tôi không thể tạo phản hồi. Có thể nội dung đã bị chặn vì lý do an toàn.", False
+        response_cache.put(key, text)
+        return text, True
+    except Exception as e:
+        logger.error("Gemini API Error: %s", e)
+        return f"Xin lỗi, có một lỗi nhỏ đã xảy ra khi tôi đang kết nối với vũ trụ: {e}", False
+
+
+async def reply_with_gemini(interaction: discord.Interaction, command: str,
+                            prompt: str, render: Callable[[str], dict],
+                            placeholder: str):
+    """Answers an interaction with Gemini's response to prompt.
+
+    render(text) returns the send/edit keyword arguments that display text.
+    Cached answers are sent straight away without touching the rate limiter.
+    Rate-limit rejections are sent as an ephemeral response; admitted
+    requests defer, wait for their slot, and stream into a placeholder.
+    """
+    reply = cached_reply(prompt)
+    if reply is not None:
+        await interaction.response.send_message(**render(reply.text))
+        log_metrics(command, reply)
+        return
+
+    is_limited, msg, wait_time, reservation = await limiter.acquire(
+        estimate_tokens(prompt))
+    if is_limited:
+        await interaction.response.send_message(msg, ephemeral=True)
+        return
+
+    # Defer and post the placeholder in the background, so the Gemini call
+    # doesn't wait on those Discord round-trips.
+    async def send_placeholder() -> discord.WebhookMessage:
+        await interaction.response.defer()
+        return await interaction.followup.send(**render(placeholder))
+
+    placeholder_task = asyncio.create_task(send_placeholder())
+    if wait_time > 0:
+        await asyncio.sleep(wait_time)
+
+    async def show_partial(text: str):
+        message = await placeholder_task
+        await message.edit(**render(text))
+
+    reply = await ask_gemini(prompt, on_partial=show_partial)
+    if not reply.ok:
+        # Failed calls don't use up the daily quota.
+        await limiter.release(reservation)
+    message = await placeholder_task
+    await message.edit(**render(reply.text))
+    log_metrics(command, reply)
+
+
+def log_metrics(command: str, reply: GeminiReply):
+    """Logs per-request metrics; call it only after the reply has been sent."""
+    logger.info("%s: ok=%s prompt_len=%d latency=%.0fms cache_hit=%s",
+                command, reply.ok, reply.prompt_len, reply.latency * 1000,
+                reply.cache_hit)
+
+
+WARM_UP_TIMEOUT = 10  # Seconds to wait for the Gemini channel on startup
+
+
+async def warm_gemini_channel():
+    """Opens the shared Gemini connection so the first command skips the TLS handshake."""
     try:
-        response = gemini_model.generate_content(prompt)
-        if not response.candidates:
-            return "Rất tiếc, tôi không thể tạo phản hồi. Có thể nội dung đã bị chặn vì lý do an toàn."
-        return response.text
+        async_client = genai_client.get_default_generative_async_client()
+        await asyncio.wait_for(
+            async_client.transport.grpc_channel.channel_ready(),
+            timeout=WARM_UP_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Gemini warm-up timed out after %ss", WARM_UP_TIMEOUT)
     except Exception as e:
-        print(f"Gemini API Error: {e}")
-        return f"Xin lỗi, có một lỗi nhỏ đã xảy ra khi tôi đang kết nối với vũ trụ: {e}"
+        logger.warning("Gemini warm-up failed: %s", e)
 
 
 # --- UI MODAL FOR TAROT ---
@@ -111,36 +573,27 @@ class TarotInquiryModal(Modal):
 
     async def callback(self, interaction: discord.Interaction):
         question = self.children[0].value
-        await interaction.response.defer(ephemeral=False)
-
-        is_limited, msg = limiter.check()
-        if is_limited:
-            await interaction.followup.send(msg, ephemeral=True)
-            return
-        limiter.record_request()
-
-        prompt = (
-            f"Bạn là một chuyên gia Tarot sâu sắc và thấu cảm. "
-            f"Lá bài đã được rút là '{self.card_info}'. Người dùng có câu hỏi: '{question}'. "
-            "Hãy phân tích, kết nối ý nghĩa của lá bài với câu hỏi để đưa ra một lời khuyên chân thành, "
-            "chi tiết và sâu sắc. Sử dụng ngôn ngữ tiếng Việt tự nhiên, gần gũi."
-        )
-        interpretation = await ask_gemini(prompt)
 
+        prompt = _TAROT_PROMPT_TMPL.format(card=self.card_info,
+                                           question=question)
         embed = discord.Embed(title=f"Lời Giải Đáp Cho Lá {self.card_info}",
-                              description=interpretation,
                               color=discord.Color.purple())
         embed.set_footer(
             text=f"Dành cho câu hỏi của {interaction.user.display_name}")
-        await interaction.followup.send(embed=embed)
+
+        def render(text: str) -> dict:
+            embed.description = truncate(text, EMBED_DESCRIPTION_LIMIT)
+            return {"embed": embed}
+
+        await reply_with_gemini(interaction, "tarot", prompt, render, "🔮 ...")
 
 
 # --- BOT EVENTS ---
 @bot.event
 async def on_ready():
-    print(f"Bot '{bot.user.name}' đã thức giấc và sẵn sàng gieo quẻ!")
-    print(f"ID: {bot.user.id}")
-    print("-" * 20)
+    logger.info("Bot '%s' đã thức giấc và sẵn sàng gieo quẻ!", bot.user.name)
+    logger.info("ID: %s", bot.user.id)
+    await warm_gemini_channel()
 
 
 # --- BOT COMMANDS ---
@@ -155,25 +608,13 @@ async def ping(ctx: discord.ApplicationContext):
 @bot.slash_command(name="tarot",
                    description="Rút một lá bài Tarot để xem vận mệnh hôm nay.")
 async def tarot(ctx: discord.ApplicationContext):
-    is_limited, msg = limiter.check()
-    if is_limited:
-        await ctx.respond(msg, ephemeral=True)
-        return
-    limiter.record_request()
-
-    await ctx.defer()
-
-    prompt = (
-        "Bạn là một người gieo bài Tarot. Hãy rút một lá bài ngẫu nhiên từ bộ bài Tarot (Major hoặc Minor Arcana). "
-        "Sau đó, chọn ngẫu nhiên trạng thái của nó (xuôi hoặc ngược). "
-        "Chỉ trả về tên lá bài và trạng thái theo định dạng: 'Tên Lá Bài (Xuôi/Ngược)'. "
-        "Ví dụ: 'The Magician (Upright)'. Trả lời bằng tiếng Việt.")
-    card_info = await ask_gemini(prompt)
+    # Drawing a card is plain randomness, so it needs no Gemini call or quota.
+    card_info = f"{random.choice(TAROT_CARDS)} ({random.choice(TAROT_ORIENTATIONS)})"
 
-    await ctx.followup.send(
-        f"Vũ trụ đã gửi một thông điệp cho {ctx.author.mention} qua lá bài **{card_info.strip()}**.\n"
+    await ctx.respond(
+        f"Vũ trụ đã gửi một thông điệp cho {ctx.author.mention} qua lá bài **{card_info}**.\n"
         "Bạn có muốn hỏi gì thêm về lá bài này không?",
-        view=TarotInquiryView(card_info.strip()))
+        view=TarotInquiryView(card_info))
 
 
 class TarotInquiryView(discord.ui.View):
@@ -199,31 +640,22 @@ class TarotInquiryView(discord.ui.View):
                    description="Hỏi một câu hỏi Có/Không, để vũ trụ trả lời.")
 async def yesno(ctx: discord.ApplicationContext, question: discord.Option(
     str, "Câu hỏi bạn muốn biết câu trả lời.")):
-    is_limited, msg = limiter.check()
-    if is_limited:
-        await ctx.respond(msg, ephemeral=True)
-        return
-    limiter.record_request()
-
-    await ctx.defer()
-
     answer = random.choice(["Có", "Không"])
-    prompt = (
-        f"Bạn là một nhà tiên tri hóm hỉnh. Với câu hỏi '{question}', "
-        f"số phận đã thì thầm câu trả lời là '{answer}'. "
-        "Hãy diễn giải câu trả lời này một cách đầy ẩn ý, thú vị, và đừng tiết lộ trực tiếp 'Có' hay 'Không'. "
-        "Hãy trả lời bằng tiếng Việt.")
-
-    presentation = await ask_gemini(prompt)
+    prompt = _YESNO_PROMPT_TMPL.format(question=question, answer=answer)
 
     embed = discord.Embed(
-        title=f"Dành cho câu hỏi của {ctx.author.display_name}",
+        title=f"{'👍' if answer == 'Có' else '👎'} Dành cho câu hỏi của {ctx.author.display_name}",
         description=f"> {question}",
         color=discord.Color.green() if answer == "Có" else discord.Color.red())
-    embed.add_field(name="Vũ trụ thì thầm...", value=presentation)
+    embed.add_field(name="Vũ trụ thì thầm...", value="")
 
-    response_message = await ctx.followup.send(embed=embed)
-    await response_message.add_reaction('👍' if answer == "Có" else '👎')
+    def render(text: str) -> dict:
+        embed.set_field_at(0,
+                           name="Vũ trụ thì thầm...",
+                           value=truncate(text, EMBED_FIELD_LIMIT))
+        return {"embed": embed}
+
+    await reply_with_gemini(ctx.interaction, "yesno", prompt, render, "🔮 ...")
 
 
 @bot.slash_command(name="diceroll",
@@ -231,7 +663,7 @@ async def yesno(ctx: discord.ApplicationContext, question: discord.Option(
 async def diceroll(ctx: discord.ApplicationContext,
                    dice: discord.Option(str,
                                         "Xúc xắc cần tung (định dạng NdN).")):
-    match = re.fullmatch(r'(\d+)d(\d+)', dice.lower())
+    match = _DICE_RE.fullmatch(dice.lower())
     if not match:
         await ctx.respond(
             "Định dạng không đúng! Hãy dùng `NdN` (ví dụ: `2d6`, `1d20`).",
@@ -245,36 +677,30 @@ async def diceroll(ctx: discord.ApplicationContext,
             ephemeral=True)
         return
 
-    is_limited, msg = limiter.check()
-    if is_limited:
-        await ctx.respond(msg, ephemeral=True)
-        return
-    limiter.record_request()
+    rolls = random.choices(range(1, num_sides + 1), k=num_dice)
+    total = sum(rolls)
 
-    await ctx.defer()
+    prompt = _DICE_PROMPT_TMPL.format(dice=dice,
+                                      rolls=', '.join(map(str, rolls)),
+                                      total=total)
 
-    rolls = [random.randint(1, num_sides) for _ in range(num_dice)]
-    total = sum(rolls)
+    header = f"**{ctx.author.mention}** tung xúc xắc...\n\n"
 
-    prompt = (
-        f"Bạn là một người dẫn truyện game đầy kịch tính. Người chơi vừa tung {dice}. "
-        f"Kết quả từng viên là: {', '.join(map(str, rolls))}. Tổng điểm là {total}. "
-        "Hãy tường thuật lại cảnh tung xúc xắc này một cách hào hùng và sống động. "
-        "Nhấn mạnh vào kết quả cuối cùng. Hãy trả lời bằng tiếng Việt.")
+    def render(text: str) -> dict:
+        return {"content": truncate(header + text, MESSAGE_CONTENT_LIMIT)}
 
-    presentation = await ask_gemini(prompt)
-    await ctx.followup.send(
-        f"**{ctx.author.mention}** tung xúc xắc...\n\n{presentation}")
+    await reply_with_gemini(ctx.interaction, "diceroll", prompt, render,
+                            "🎲 ...")
 
 
 # --- RUN BOT ---
-if __name__ == "__main__":
+def main():
+    """Starts the bot and blocks until it shuts down. Called from main.py."""
     try:
-        print("Starting Discord bot...")
+        logger.info("Starting Discord bot...")
         bot.run(DISCORD_BOT_TOKEN)
     except discord.errors.LoginFailure:
-        print(
-            "ERROR: Invalid Discord bot token. Please check your DETERMINATION.ENV file."
-        )
+        logger.error(
+            "Invalid Discord bot token. Please check your DETERMINATION.ENV file.")
     except Exception as e:
-        print(f"ERROR: Failed to start bot: {e}")
+        logger.error("Failed to start bot: %s", e)